@@ -1,45 +1,77 @@
 #!/usr/bin/env python3
+import io
 import os
 import sys
 import json
+import shutil
+import mmap
+import bisect
 import difflib
+import filecmp
 import zipfile
 import tempfile
 import logging
 import html
+import hashlib
+from collections import Counter
 from pathlib import Path
 import subprocess
-from typing import List
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+try:
+    from lxml import etree as lxml_etree  # optional: faster parse + pretty_print
+except ImportError:
+    lxml_etree = None
+
+try:
+    import orjson  # optional: C-accelerated JSON for the comment bodies file
+except ImportError:
+    orjson = None
+
+try:
+    from cdifflib import CSequenceMatcher as _SequenceMatcher  # optional: C port of difflib's matcher
+except ImportError:
+    _SequenceMatcher = difflib.SequenceMatcher
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(message)s")
 
 COMMENT_FILE = os.getenv("SAFE_COMMENT_JSON", "comment_bodies.json")
 SAFE_COMMENT_SIZE = int(os.getenv("SAFE_COMMENT_SIZE", "60000"))  # bytes
 MAX_LINES_PER_PART = int(os.getenv("MAX_LINES_PER_PART", "2000"))  # fallback
+DIFF_WORKERS = int(os.getenv("DIFF_WORKERS", str(os.cpu_count() or 1)))  # parallel per-file diffs
+# workbooks whose average line is longer than this are pretty-printed before diffing
+PRETTY_PRINT_MIN_AVG_LINE = int(os.getenv("PRETTY_PRINT_MIN_AVG_LINE", "2000"))  # bytes
 # minimal internal allowance for fenced wrapper bytes
 FENCED_OVERHEAD_BYTES = len("```diff\n") + len("\n```")
 
 def byte_len(s: str) -> int:
     if s is None:
         return 0
-    return len(s.encode("utf-8"))
+    # ASCII text (most workbook XML) is one byte per char; skip building the bytes object
+    return len(s) if s.isascii() else len(s.encode("utf-8"))
 
-def extract_file(path, workdir):
+def extract_file(path, workdir, data: Optional[bytes] = None):
     """
     If .twbx, extract the embedded .twb file to a temp dir.
     Otherwise, return the file path unchanged.
+    `data` is the .twbx content when it is already in memory; it is then
+    read through BytesIO and `path` is only used for its extension.
     """
     if not path:
         return None
     if path.lower().endswith(".twbx"):
         try:
-            with zipfile.ZipFile(path, "r") as zf:
-                for name in zf.namelist():
-                    if name.lower().endswith(".twb"):
-                        extracted = Path(workdir) / Path(name).name
-                        with zf.open(name) as src, open(extracted, "wb") as dst:
-                            dst.write(src.read())
-                        logging.info("[extract] Extracted %s -> %s", name, extracted)
+            with zipfile.ZipFile(io.BytesIO(data) if data is not None else path, "r") as zf:
+                # walk the already-parsed central directory; open the entry by its ZipInfo (no name lookup)
+                for info in zf.infolist():
+                    if info.filename.lower().endswith(".twb"):
+                        extracted = Path(workdir) / Path(info.filename).name
+                        # stream in 64 KiB blocks instead of holding the whole .twb in memory
+                        with zf.open(info) as src, open(extracted, "wb") as dst:
+                            shutil.copyfileobj(src, dst, length=1 << 16)
+                        logging.debug("[extract] Extracted %s -> %s", info.filename, extracted)
                         return str(extracted)
         except Exception as e:
             logging.warning("Failed extracting twbx %s: %s", path, e)
@@ -47,26 +79,299 @@ def extract_file(path, workdir):
         return None
     return path
 
-def run_diff(file_a, file_b):
+def _is_single_line_xml(path) -> bool:
+    """True if the file looks minified (few, very long lines), where a line diff is useless."""
+    try:
+        size = os.path.getsize(path)
+        newlines = 0
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                newlines += block.count(b"\n")
+    except OSError:
+        return False
+    return size // (newlines + 1) > PRETTY_PRINT_MIN_AVG_LINE
+
+def canonicalize_xml(path, out):
+    """Re-serialize XML one element per line (lxml if installed, else ElementTree)."""
+    if lxml_etree is not None:
+        parser = lxml_etree.XMLParser(resolve_entities=False, huge_tree=True)
+        tree = lxml_etree.parse(str(path), parser)
+        tree.write(str(out), pretty_print=True, encoding="utf-8", xml_declaration=True)
+    else:
+        tree = ET.parse(path)
+        ET.indent(tree)
+        tree.write(out, encoding="utf-8", xml_declaration=True)
+    return out
+
+def _canonical_copy(path, workdir):
+    """Pretty-printed copy of `path` in workdir, reused while the source is unchanged."""
+    st = os.stat(path)
+    key = hashlib.sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+    out = Path(workdir) / f"canon_{key}.xml"
+    if not out.exists():
+        canonicalize_xml(path, out)
+    return str(out)
+
+def run_diff(file_a, file_b, workdir=None):
     """
     Generate a unified diff between two files.
     Returns diff lines as a list of strings (no trailing newlines).
+    Uses git's C histogram diff; falls back to difflib if git is unavailable.
+    Minified workbooks are pretty-printed (both sides) first so the diff is line-oriented.
+    """
+    name_a, name_b = Path(file_a).name, Path(file_b).name
+    # unchanged embedded .twb (e.g. only the extract in a .twbx changed): size check, then a
+    # block compare, which is cheaper than spawning git or pretty-printing both sides
+    try:
+        if filecmp.cmp(file_a, file_b, shallow=False):
+            return []
+    except OSError:
+        pass
+    if _is_single_line_xml(file_a) or _is_single_line_xml(file_b):
+        try:
+            workdir = workdir or tempfile.gettempdir()
+            file_a, file_b = _canonical_copy(file_a, workdir), _canonical_copy(file_b, workdir)
+        except Exception as e:
+            logging.warning("Could not pretty-print %s / %s for diffing: %s", file_a, file_b, e)
+    out = []
+    # stderr goes to a temp file: a pipe nobody drains until stdout closes could fill and hang git
+    with tempfile.TemporaryFile() as err_file:
+        try:
+            proc = subprocess.Popen(
+                # --text: a stray NUL would otherwise make git print "Binary files ... differ" and no hunks
+                ["git", "--no-pager", "diff", "--no-index", "--no-color", "--no-ext-diff", "--text",
+                 "--histogram", "--ignore-cr-at-eol", "--unified=3", "--", str(file_a), str(file_b)],
+                stdout=subprocess.PIPE, stderr=err_file, text=True, encoding="utf-8", errors="replace",
+            )
+        except OSError as e:
+            logging.warning("git diff unavailable (%s); falling back to difflib", e)
+            return _difflib_run_diff(file_a, file_b)
+        with proc:
+            # hunks are parsed straight off the pipe: git's full output never sits in memory
+            # as one string plus its line list next to the parsed result
+            lines = (ln[:-1] if ln.endswith("\n") else ln for ln in proc.stdout)
+            # drop git's "diff --git"/"index" preamble and label the headers like difflib did
+            for ln in lines:
+                if ln.startswith("--- "):
+                    next(lines, None)  # the "+++ " line
+                    break
+            for hunk in _split_hunks(lines):
+                hunk = _fold_eof_newline_change(hunk)
+                if hunk:
+                    out.extend(hunk)
+        # exit code 1 just means the files differ
+        if proc.returncode not in (0, 1):
+            err_file.seek(0)
+            stderr = err_file.read().decode("utf-8", errors="replace")
+            logging.warning("git diff failed for %s vs %s: %s", file_a, file_b, stderr.strip())
+            return _difflib_run_diff(file_a, file_b)
+    if proc.returncode == 1 and not out:
+        # git saw a difference but produced no hunk we could parse; let difflib decide
+        return _difflib_run_diff(file_a, file_b)
+    return [f"--- {name_a}", f"+++ {name_b}"] + out if out else []
+
+def _split_hunks(lines):
+    hunk = []
+    for ln in lines:
+        if ln.startswith("@@") and hunk:
+            yield hunk
+            hunk = []
+        hunk.append(ln)
+    if hunk:
+        yield hunk
+
+def _fold_eof_newline_change(hunk):
+    """
+    Make a git hunk read like difflib's (which compares lines without their
+    newline): drop the function-context text after the @@ range, and turn a
+    last line that only gained/lost its trailing newline back into context.
+    Returns None if nothing but that newline changed.
+    """
+    header = hunk[0]
+    end = header.find(" @@", 3)
+    if end != -1:
+        header = header[:end + 3]
+    body = hunk[1:]
+    if any(ln.startswith("\\") for ln in body):
+        body = [ln for ln in body if not ln.startswith("\\")]
+        last_del = max((k for k, ln in enumerate(body) if ln.startswith("-")), default=-1)
+        last_add = max((k for k, ln in enumerate(body) if ln.startswith("+")), default=-1)
+        if (last_del != -1 and last_add != -1 and body[last_del][1:] == body[last_add][1:]
+                and max(last_del, last_add) == len(body) - 1):
+            same = " " + body[last_add][1:]
+            body = [ln for k, ln in enumerate(body) if k not in (last_del, last_add)] + [same]
+        if not any(ln[:1] in ("-", "+") for ln in body):
+            return None
+    return [header] + body
+
+def read_text_lines(path) -> List[str]:
+    """
+    Lines of a text file without their newlines, like `[l.rstrip("\n") for l in f.readlines()]`
+    but read in one call and split in C. Splits on "\n" only (after universal-newline
+    translation), not on the extra separators str.splitlines() recognises.
+    """
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        lines = f.read().split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return lines
+
+def iter_text_lines(path):
     """
+    Yield the same lines as read_text_lines(), decoding one line at a time from an
+    mmap of the file. Used where the whole file is only walked once (previews,
+    added/removed dumps) so large workbooks are never held as one decoded string.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return  # mmap cannot map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for raw in iter(mm.readline, b""):
+                text = raw.decode("utf-8", errors="ignore")
+                if "\r" in text:
+                    # universal newlines, as text-mode open() would apply them
+                    text = text.replace("\r\n", "\n").replace("\r", "\n")
+                    yield from (text[:-1] if text.endswith("\n") else text).split("\n")
+                elif text:  # an undecodable final line without "\n" decodes to nothing
+                    yield text[:-1] if text.endswith("\n") else text
+
+def _difflib_run_diff(file_a, file_b):
     try:
-        with open(file_a, encoding="utf-8", errors="ignore") as f1, \
-             open(file_b, encoding="utf-8", errors="ignore") as f2:
-            a_lines = [l.rstrip("\n") for l in f1.readlines()]
-            b_lines = [l.rstrip("\n") for l in f2.readlines()]
+        a_lines = read_text_lines(file_a)
+        b_lines = read_text_lines(file_b)
     except Exception as e:
         logging.error("Failed to read files %s vs %s: %s", file_a, file_b, e)
         return []
 
-    diff_iter = difflib.unified_diff(
-        a_lines, b_lines,
-        fromfile=Path(file_a).name, tofile=Path(file_b).name,
-        lineterm=""
-    )
-    return list(diff_iter)
+    return unified_diff(a_lines, b_lines, Path(file_a).name, Path(file_b).name)
+
+def _format_unified_range(start: int, stop: int) -> str:
+    # same range format difflib.unified_diff uses in @@ headers
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+def _unique_line_anchors(a: List[str], b: List[str]) -> List[Tuple[int, int]]:
+    """
+    (i, j) pairs of lines that occur exactly once in a and once in b, reduced to the
+    longest run that is increasing on both sides (patience sorting, O(n log n)).
+    """
+    count_a, count_b = Counter(a), Counter(b)
+    pos_b = {ln: j for j, ln in enumerate(b) if count_b[ln] == 1}
+    pairs = [(i, pos_b[ln]) for i, ln in enumerate(a) if count_a[ln] == 1 and ln in pos_b]
+
+    tails: List[int] = []    # index into pairs of the smallest tail of each run length
+    tails_j: List[int] = []
+    prev = [-1] * len(pairs)
+    for k, (_i, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails_j, j)
+        if pos:
+            prev[k] = tails[pos - 1]
+        if pos == len(tails):
+            tails.append(k)
+            tails_j.append(j)
+        else:
+            tails[pos] = k
+            tails_j[pos] = j
+    anchors = []
+    k = tails[-1] if tails else -1
+    while k != -1:
+        anchors.append(pairs[k])
+        k = prev[k]
+    anchors.reverse()
+    return anchors
+
+def _common_affixes(a: list, b: list) -> Tuple[int, int]:
+    """Lengths of the common leading and trailing runs of a and b (never overlapping)."""
+    n = min(len(a), len(b))
+    pfx = 0
+    while pfx < n and a[pfx] == b[pfx]:
+        pfx += 1
+    sfx = 0
+    while sfx < n - pfx and a[-1 - sfx] == b[-1 - sfx]:
+        sfx += 1
+    return pfx, sfx
+
+def _anchored_opcodes(a: List[str], b: List[str]) -> List[Tuple[str, int, int, int, int]]:
+    """
+    Opcodes for a -> b in SequenceMatcher.get_opcodes() form. The common leading and
+    trailing lines are split off first; in the middle, unique-line anchors are
+    matched (histogram/patience style) and the matcher only runs on the gaps
+    between them, which in workbook XML are small.
+    """
+    codes: List[Tuple[str, int, int, int, int]] = []
+
+    def add(tag, i1, i2, j1, j2):
+        if tag == "equal" and codes and codes[-1][0] == "equal":
+            codes[-1] = ("equal", codes[-1][1], i2, codes[-1][3], j2)
+        else:
+            codes.append((tag, i1, i2, j1, j2))
+
+    pfx, sfx = _common_affixes(a, b)
+    end_a, end_b = len(a) - sfx, len(b) - sfx
+    if pfx:
+        add("equal", 0, pfx, 0, pfx)
+    prev_i = prev_j = pfx
+    for i, j in [(pfx + i, pfx + j) for i, j in _unique_line_anchors(a[pfx:end_a], b[pfx:end_b])] + [(end_a, end_b)]:
+        if prev_i < i or prev_j < j:
+            for tag, i1, i2, j1, j2 in _SequenceMatcher(None, a[prev_i:i], b[prev_j:j]).get_opcodes():
+                add(tag, prev_i + i1, prev_i + i2, prev_j + j1, prev_j + j2)
+        if i < end_a:
+            add("equal", i, i + 1, j, j + 1)
+        prev_i, prev_j = i + 1, j + 1
+    if sfx:
+        add("equal", end_a, len(a), end_b, len(b))
+    return codes
+
+def _group_opcodes(codes: List[Tuple[str, int, int, int, int]], n: int = 3):
+    """Hunks with n lines of context; same grouping as SequenceMatcher.get_grouped_opcodes."""
+    codes = list(codes) or [("equal", 0, 1, 0, 1)]
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # a long unchanged run closes the current hunk and opens the next one
+        if tag == "equal" and i2 - i1 > n + n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+def unified_diff(a: List[str], b: List[str], fromfile: str, tofile: str, n: int = 3) -> List[str]:
+    """
+    Unified diff lines in difflib.unified_diff(..., lineterm="") format. Hunks come
+    from _anchored_opcodes, so _SequenceMatcher (cdifflib's C implementation when
+    installed) only sees the regions between unique-line anchors.
+    """
+    out: List[str] = []
+    for group in _group_opcodes(_anchored_opcodes(a, b), n):
+        if not out:
+            out.extend((f"--- {fromfile}", f"+++ {tofile}"))
+        first, last = group[0], group[-1]
+        out.append(f"@@ -{_format_unified_range(first[1], last[2])} "
+                   f"+{_format_unified_range(first[3], last[4])} @@")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                out.extend(" " + ln for ln in a[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                out.extend("-" + ln for ln in a[i1:i2])
+            if tag in ("replace", "insert"):
+                out.extend("+" + ln for ln in b[j1:j2])
+    return out
+
 
 def chunk_lines_by_bytes(lines: List[str], max_bytes: int) -> List[List[str]]:
     """
@@ -79,8 +384,7 @@ def chunk_lines_by_bytes(lines: List[str], max_bytes: int) -> List[List[str]]:
     safe_max = max(max_bytes - FENCED_OVERHEAD_BYTES - 200, 200)  # leave wiggle room
 
     for ln in lines:
-        ln_with_n = ln + "\n"
-        ln_b = byte_len(ln_with_n)
+        ln_b = byte_len(ln) + 1  # + the joining "\n" (one byte in UTF-8)
         # If a single line is larger than safe_max, break it into smaller byte-safe pieces.
         if ln_b > safe_max:
             # flush current
@@ -89,7 +393,7 @@ def chunk_lines_by_bytes(lines: List[str], max_bytes: int) -> List[List[str]]:
                 cur = []
                 cur_bytes = 0
             # force-slice the long line at byte boundaries
-            b = ln_with_n.encode("utf-8")
+            b = (ln + "\n").encode("utf-8")
             start = 0
             while start < len(b):
                 end = min(start + safe_max, len(b))
@@ -119,6 +423,17 @@ def chunk_lines_by_bytes(lines: List[str], max_bytes: int) -> List[List[str]]:
         groups.append(cur)
     return groups
 
+_SECTION_HEADER_TMPL = (
+    "<details>\n<summary>{fname} ({status})</summary>\n\n"
+    "**Preview:**\n\n{preview}\n\n"
+    "**Legend:** `+` = addition (green), `-` = removal (red)\n\n"
+)
+_DIFF_PART_TMPL = (
+    "<details>\n<summary>Diff Part {idx}/{total} — click to expand</summary>\n\n"
+    "```diff\n{body}\n```\n\n</details>\n"
+)
+_SECTION_FOOTER = "\n</details>\n\n---\n"
+
 def build_file_section(pr_number: str, fname: str, status: str, preview: str, diff_lines: List[str]) -> List[str]:
     """
     Build one top-level file section. Returns one or more HTML/markdown strings
@@ -127,24 +442,26 @@ def build_file_section(pr_number: str, fname: str, status: str, preview: str, di
     chunked further by total bytes.
     """
     fname_safe = html.escape(fname)
+    status_lc = status.lower()
+    is_added = status == "A" or status_lc == "added"
+    is_removed = status == "D" or status_lc == "removed"
     # emoji for status
-    if status == "A" or status.lower() == "added":
+    if is_added:
         status_label = "➕ added"
-    elif status == "D" or status.lower() == "removed":
+    elif is_removed:
         status_label = "➖ removed"
     else:
         status_label = "✏️ modified"
 
-    header = f"<details>\n<summary>{fname_safe} ({status_label})</summary>\n\n"
-    header += f"**Preview:**\n\n{html.escape(preview or '(no preview available)')}\n\n"
-    header += "**Legend:** `+` = addition (green), `-` = removal (red)\n\n"
+    header = _SECTION_HEADER_TMPL.format(
+        fname=fname_safe, status=status_label, preview=html.escape(preview or "(no preview available)"))
 
     body_parts: List[str] = []
     # if this is an added file and no diff_lines, try to show a short 'Added' message
-    if (status == "A" or status.lower() == "added") and (not diff_lines):
+    if is_added and not diff_lines:
         inner = "_(New file — content omitted)_\n"
         body_parts.append(inner)
-    elif (status == "D" or status.lower() == "removed") and (not diff_lines):
+    elif is_removed and not diff_lines:
         inner = "_(Removed file — content omitted)_\n"
         body_parts.append(inner)
     else:
@@ -154,22 +471,39 @@ def build_file_section(pr_number: str, fname: str, status: str, preview: str, di
         else:
             groups = chunk_lines_by_bytes(diff_lines, SAFE_COMMENT_SIZE)
             total = len(groups)
-            for idx, grp in enumerate(groups, start=1):
-                # prepare fenced diff
-                fenced = "```diff\n" + "\n".join(grp) + "\n```"
-                # each group is placed inside a nested details for compactness
-                part = (
-                    f"<details>\n<summary>Diff Part {idx}/{total} — click to expand</summary>\n\n"
-                    f"{fenced}\n\n</details>\n"
-                )
-                body_parts.append(part)
-
-    footer = "\n</details>\n\n---\n"
+            # each group is a fenced diff inside a nested details for compactness
+            body_parts.extend(
+                _DIFF_PART_TMPL.format(idx=idx, total=total, body="\n".join(grp))
+                for idx, grp in enumerate(groups, start=1)
+            )
+
     # combine header + parts + footer into one string (single file section)
-    combined = header + "".join(body_parts) + footer
-    return [combined]
+    return ["".join([header, *body_parts, _SECTION_FOOTER])]
 
-def split_top_level_bodies(sections: List[str], max_bytes: int) -> List[str]:
+_DUPLICATE_SECTION_TMPL = (
+    "<details>\n<summary>{fname} (same changes as {first})</summary>\n\n"
+    "_Diff identical to {first} above — not repeated._\n\n</details>\n\n---\n"
+)
+
+def build_duplicate_section(fname: str, first_fname: str) -> str:
+    """Short stand-in section for a file whose diff matches an earlier file's (renames, copies)."""
+    return _DUPLICATE_SECTION_TMPL.format(fname=html.escape(fname), first=html.escape(first_fname))
+
+def diff_content_key(diff_lines: List[str]) -> Optional[bytes]:
+    """
+    Digest of a diff's body, ignoring the ---/+++ labels (they carry per-file names),
+    so identical changes to differently named workbooks compare equal. None if empty.
+    """
+    body = diff_lines[2:] if diff_lines[:1] and diff_lines[0].startswith("--- ") else diff_lines
+    if not body:
+        return None
+    h = hashlib.blake2b(digest_size=16)
+    for ln in body:
+        h.update(ln.encode("utf-8", errors="replace"))
+        h.update(b"\n")
+    return h.digest()
+
+def split_top_level_bodies(sections: List[str], max_bytes: int, pr_number: str = "") -> List[str]:
     """
     Pack multiple section strings (which may contain nested fenced blocks)
     into comment bodies ensuring each body <= max_bytes bytes.
@@ -177,60 +511,162 @@ def split_top_level_bodies(sections: List[str], max_bytes: int) -> List[str]:
     until adding it would exceed max_bytes, then start a new body.
     """
     bodies = []
-    cur = ""
+    # accumulate pieces and join on flush; repeated `+=` on a growing body is quadratic
+    cur: List[str] = []
     cur_b = 0
     for s in sections:
         s_b = byte_len(s)
         if cur_b + s_b <= max_bytes:
-            cur += s
+            cur.append(s)
             cur_b += s_b
         else:
-            if cur:
-                bodies.append(cur)
+            if cur_b:
+                bodies.append("".join(cur))
             # if single section is larger than max_bytes (rare because we chunked diffs),
             # further split it by lines as a last resort.
             if s_b > max_bytes:
                 logging.warning("Single file section exceeds max bytes; splitting by lines as fallback.")
                 lines = s.splitlines(keepends=True)
-                temp = ""
+                temp: List[str] = []
                 temp_b = 0
                 for ln in lines:
                     ln_b = byte_len(ln)
                     if temp_b + ln_b > max_bytes:
-                        bodies.append(temp)
-                        temp = ln
+                        bodies.append("".join(temp))
+                        temp = [ln]
                         temp_b = ln_b
                     else:
-                        temp += ln
+                        temp.append(ln)
                         temp_b += ln_b
                 if temp:
-                    bodies.append(temp)
-                cur = ""
+                    bodies.append("".join(temp))
+                cur = []
                 cur_b = 0
             else:
-                cur = s
+                cur = [s]
                 cur_b = s_b
-    if cur:
-        bodies.append(cur)
+    if cur_b:
+        bodies.append("".join(cur))
     # add a small tip at the end of last body
     if bodies:
         if byte_len(bodies[-1]) + 200 < max_bytes:
-            bodies[-1] += f"\n\n*Tip:* Search for the tag `#tableau-diff-pr {os.getenv('PR_NUMBER','')}` to find these comments."
+            bodies[-1] += f"\n\n*Tip:* Search for the tag `#tableau-diff-pr {pr_number}` to find these comments."
     return bodies
 
 def make_preview_from_file(path: str, max_lines: int = 6) -> str:
     try:
-        with open(path, encoding="utf-8", errors="ignore") as f:
-            preview_lines = []
-            for ln in f:
-                if ln.strip():
-                    preview_lines.append(ln.strip())
-                if len(preview_lines) >= max_lines:
-                    break
-            return "\n".join(preview_lines)
+        preview_lines = []
+        for ln in iter_text_lines(path):
+            if ln.strip():
+                preview_lines.append(ln.strip())
+            if len(preview_lines) >= max_lines:
+                break
+        return "\n".join(preview_lines)
     except Exception:
         return "(could not extract preview)"
 
+def parse_name_status_z(output: bytes) -> List[Tuple[str, str, str]]:
+    """
+    Parse `git diff --name-status -z` into (status, path, base_path) for Tableau files.
+    Fields are NUL-separated, so paths with spaces, tabs or quotes come through verbatim;
+    renames/copies (R/C) carry the old path as base_path, otherwise it equals path.
+    """
+    fields = output.split(b"\0")
+    entries = []
+    k = 0
+    while k + 1 < len(fields):
+        status = fields[k].decode("ascii", errors="replace")
+        if status[:1] in ("R", "C") and k + 2 < len(fields):
+            base_path, path = fields[k + 1], fields[k + 2]
+            k += 3
+        else:
+            base_path = path = fields[k + 1]
+            k += 2
+        # filter on the raw bytes; only matches get decoded
+        if path.lower().endswith((b".twb", b".twbx")):
+            entries.append((status, os.fsdecode(path), os.fsdecode(base_path)))
+    return entries
+
+def read_blob(cat_file, spec):
+    """
+    Look up `<rev>:<path>` through a running `git cat-file --batch` process.
+    Returns the blob bytes, or None if the object is missing or not a blob.
+    """
+    cat_file.stdin.write(spec.encode("utf-8") + b"\n")
+    cat_file.stdin.flush()
+    header = cat_file.stdout.readline().decode("utf-8", errors="replace").rstrip("\n")
+    if not header or header.endswith((" missing", " ambiguous")):
+        return None
+    _sha, obj_type, size = header.rsplit(" ", 2)
+    data = cat_file.stdout.read(int(size))
+    cat_file.stdout.read(1)  # LF that terminates every object
+    return data if obj_type == "blob" else None
+
+def process_one(pr_number: str, status: str, fname: str, base_tmp,
+                file_dir: str) -> Tuple[Optional[bytes], List[str]]:
+    """
+    Diff one changed workbook and render its section(s); also returns the
+    diff_content_key so main can collapse files with identical changes.
+    `base_tmp` is the base blob written to disk, or the blob bytes themselves
+    for a .twbx (None for added files); all extraction happens under
+    `file_dir`. Runs in a worker process.
+    """
+    logging.debug("Processing %s (%s)", fname, status)
+    base_dir = Path(file_dir) / "base"
+    head_dir = Path(file_dir) / "head"
+    base_dir.mkdir(exist_ok=True)
+    head_dir.mkdir(exist_ok=True)
+
+    # head file path is local working tree file (relative path); gone for deleted files
+    file_head_path = extract_file(fname, str(head_dir)) if os.path.exists(fname) else None
+    if isinstance(base_tmp, bytes):
+        file_base_path = extract_file(fname, str(base_dir), data=base_tmp)
+    else:
+        file_base_path = extract_file(base_tmp, str(base_dir)) if base_tmp else None
+
+    # Build preview from whichever we have
+    preview = ""
+    if file_head_path:
+        preview = make_preview_from_file(file_head_path)
+    elif file_base_path:
+        preview = make_preview_from_file(file_base_path)
+
+    if file_base_path and file_head_path:
+        diff_lines = run_diff(file_base_path, file_head_path, file_dir)
+    elif file_head_path and not file_base_path:
+        # added file: read head file content and present it as plus-prefixed lines
+        try:
+            diff_lines = ["+" + l for l in iter_text_lines(file_head_path)]
+        except Exception:
+            diff_lines = [f"+ (could not read new file content for {fname})"]
+    elif file_base_path and not file_head_path:
+        try:
+            diff_lines = ["-" + l for l in iter_text_lines(file_base_path)]
+        except Exception:
+            diff_lines = [f"- (could not read old file content for {fname})"]
+    else:
+        logging.warning("No head or base content available for %s — skipping", fname)
+        return None, []
+
+    # build one or more HTML/markdown sections for this file
+    return diff_content_key(diff_lines), build_file_section(pr_number, fname, status, preview, diff_lines)
+
+def write_comment_json(path: str, bodies: List[str]) -> None:
+    """
+    Write the comment bodies as compact UTF-8 JSON (orjson when installed). Non-ASCII
+    stays raw instead of \\uXXXX-escaped; bodies that cannot be encoded as UTF-8
+    (lone surrogates from undecodable file names) fall back to escaped stdlib JSON.
+    """
+    try:
+        if orjson is not None:
+            data = orjson.dumps(bodies)
+        else:
+            data = json.dumps(bodies, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    except (TypeError, ValueError):  # orjson.JSONEncodeError / UnicodeEncodeError
+        data = json.dumps(bodies).encode("ascii")
+    with open(path, "wb") as f:
+        f.write(data)
+
 def main():
     base_branch = os.getenv("BASE_BRANCH")
     head_branch = os.getenv("HEAD_BRANCH")
@@ -248,98 +684,73 @@ def main():
     # Ensure remote base exists as origin/<base_branch> — Jenkinsfile typically fetches it already,
     # but attempt a fetch (ignore failures)
     try:
-        subprocess.check_call(f"git fetch origin +refs/heads/{base_branch}:refs/remotes/origin/{base_branch}", shell=True)
+        subprocess.check_call(["git", "fetch", "origin", f"+refs/heads/{base_branch}:refs/remotes/origin/{base_branch}"])
     except Exception:
         logging.debug("Fetching origin/%s failed or not necessary", base_branch)
 
     # Use git to list changed files between base and head
-    cmd = f"git diff --name-status origin/{base_branch}...HEAD"
+    cmd = ["git", "diff", "--name-status", "-z", f"origin/{base_branch}...HEAD"]
     try:
-        output = subprocess.check_output(cmd, shell=True, text=True)
+        output = subprocess.check_output(cmd)
     except subprocess.CalledProcessError as e:
         logging.error("git diff command failed: %s", e)
         sys.exit(1)
 
-    changed_files = []
-    for line in output.strip().splitlines():
-        if not line.strip():
-            continue
-        parts = line.split(maxsplit=1)
-        if len(parts) < 2:
-            continue
-        status, fname = parts[0], parts[1]
-        if fname.lower().endswith((".twb", ".twbx")):
-            changed_files.append((status, fname))
+    changed_files = parse_name_status_z(output)
 
     logging.info("Detected %d Tableau file(s) changed", len(changed_files))
 
-    for status, fname in changed_files:
-        logging.info("Processing %s (%s)", fname, status)
-        # head file path is local working tree file (relative path)
-        file_head_path = extract_file(fname, workdir)
-        # prepare base tempfile path
-        base_tmp = Path(workdir) / f"base_{Path(fname).name}"
-        file_base_path = None
-
-        # Try to extract base version from origin/<base_branch>
+    # one git process serves every base blob instead of a `git show` per file;
+    # blobs are written out up front so the diffs below can run in worker processes
+    cat_file = subprocess.Popen(["git", "cat-file", "--batch"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    base_rev = f"origin/{base_branch}"
+    jobs = []
+    for i, (status, fname, base_fname) in enumerate(changed_files):
+        # each file gets its own directory so same-named embedded .twb files cannot collide
+        file_dir = Path(workdir) / f"{i:04d}"
+        file_dir.mkdir()
+        base_tmp = None
         try:
-            # Use git show to dump file; this may fail (deleted file / new file)
-            subprocess.check_call(f"git show origin/{base_branch}:{fname} > {base_tmp}", shell=True)
-            file_base_path = extract_file(str(base_tmp), workdir)
+            # missing for new files
+            blob = read_blob(cat_file, f"{base_rev}:{base_fname}")
+            if blob is None:
+                logging.debug("Base version not available for %s", fname)
+            elif fname.lower().endswith(".twbx"):
+                # only the embedded .twb is needed on disk; the archive is unzipped from memory
+                base_tmp = blob
+            else:
+                base_tmp = file_dir / f"base_{Path(fname).name}"
+                base_tmp.write_bytes(blob)
+                base_tmp = str(base_tmp)
         except Exception:
             logging.debug("Base version not available for %s", fname)
-
-        # If head file is a twbx path in worktree, extract its twb to temp as well for consistent diff
-        head_tmp = None
-        if file_head_path and file_head_path.lower().endswith(".twbx"):
-            head_tmp = Path(workdir) / f"head_{Path(fname).name}"
-            try:
-                # use same extract_file logic by copying current file to head_tmp then extracting
-                subprocess.check_call(f"cp '{fname}' '{head_tmp}'", shell=True)
-                file_head_path = extract_file(str(head_tmp), workdir)
-            except Exception:
-                logging.debug("Could not prepare head extracted file for %s", fname)
-
-        # Build preview from whichever we have
-        preview = ""
-        if file_head_path:
-            preview = make_preview_from_file(file_head_path)
-        elif file_base_path:
-            preview = make_preview_from_file(file_base_path)
-
-        if file_base_path and file_head_path:
-            diff_lines = run_diff(file_base_path, file_head_path)
-        elif file_head_path and not file_base_path:
-            # added file: read head file content and present it as plus-prefixed lines
-            try:
-                with open(file_head_path, encoding="utf-8", errors="ignore") as fh:
-                    content_lines = [l.rstrip("\n") for l in fh.readlines()]
-                diff_lines = ["+" + l for l in content_lines]
-            except Exception:
-                diff_lines = [f"+ (could not read new file content for {fname})"]
-        elif file_base_path and not file_head_path:
-            try:
-                with open(file_base_path, encoding="utf-8", errors="ignore") as fb:
-                    content_lines = [l.rstrip("\n") for l in fb.readlines()]
-                diff_lines = ["-" + l for l in content_lines]
-            except Exception:
-                diff_lines = [f"- (could not read old file content for {fname})"]
-        else:
-            logging.warning("No head or base content available for %s — skipping", fname)
-            continue
-
-        # build one or more HTML/markdown sections for this file
-        file_sections = build_file_section(pr_number, fname, status, preview, diff_lines)
+        jobs.append((pr_number, status, fname, base_tmp, str(file_dir)))
+    cat_file.stdin.close()
+    cat_file.wait()
+
+    workers = min(DIFF_WORKERS, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(process_one, *zip(*jobs)))
+    else:
+        results = [process_one(*job) for job in jobs]
+    # renamed/copied workbooks often carry the exact same diff; render it once
+    first_with_key: Dict[bytes, str] = {}
+    for (_status, fname, _base_fname), (key, file_sections) in zip(changed_files, results):
+        if key is not None:
+            first = first_with_key.setdefault(key, fname)
+            if first != fname:
+                sections_all.append(build_duplicate_section(fname, first))
+                continue
         sections_all.extend(file_sections)
 
     if not sections_all:
         logging.info("No Tableau diffs to report.")
-        with open(COMMENT_FILE, "w", encoding="utf-8") as f:
-            json.dump([f"#tableau-diff-pr {pr_number}\nNo relevant changes detected."], f)
+        write_comment_json(COMMENT_FILE, [f"#tableau-diff-pr {pr_number}\nNo relevant changes detected."])
         return
 
     # Pack sections into comment bodies <= SAFE_COMMENT_SIZE bytes
-    comment_bodies = split_top_level_bodies(sections_all, SAFE_COMMENT_SIZE)
+    comment_bodies = split_top_level_bodies(sections_all, SAFE_COMMENT_SIZE, pr_number)
 
     # final sanity: ensure each body <= SAFE_COMMENT_SIZE; if not, truncate as last resort
     final_bodies = []
@@ -354,8 +765,7 @@ def main():
         truncated += "\n\n*Truncated due to size.*"
         final_bodies.append(truncated)
 
-    with open(COMMENT_FILE, "w", encoding="utf-8") as f:
-        json.dump(final_bodies, f)
+    write_comment_json(COMMENT_FILE, final_bodies)
 
     logging.info("Saved %d comment body part(s) into %s", len(final_bodies), COMMENT_FILE)
 